@@ -0,0 +1,6 @@
+"""
+Throughput benchmarks for dustbunny. Run them with::
+
+    python -m benchmarks --output results.json
+
+"""
@@ -0,0 +1,117 @@
+"""
+Run the benchmarks and write the results as JSON::
+
+    python -m benchmarks --size 1000 --output results.json
+    python -m benchmarks --case execute_wide --backend memory
+    python -m benchmarks --compare before.json --output after.json
+
+Every case runs in its own process, so peak RSS is per case.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import dustbunny
+
+from .cases import CASES, BACKENDS, run_case
+
+
+def _version(dist):
+    try:
+        from importlib.metadata import version
+        return version(dist)
+    except Exception:
+        return None
+
+
+def _git(*args):
+    try:
+        out = subprocess.run(('git',) + args, cwd=os.path.dirname(os.path.abspath(dustbunny.__file__)),
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.decode('utf-8').strip()
+
+
+def _source():
+    """
+    Which dustbunny was measured: where it was imported from, and the git revision if it's a checkout.
+    """
+    revision = _git('rev-parse', 'HEAD')
+    return {
+        'version': _version('dustbunny'),
+        'path': os.path.dirname(os.path.abspath(dustbunny.__file__)),
+        'git_revision': revision,
+        'git_dirty': bool(_git('status', '--porcelain', '--', '.')) if revision else None,
+    }
+
+
+def _run_isolated(name, backend, size):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(run_case, name, backend, size).result()
+
+
+def _compare(baseline, results):
+    before = {(r['case'], r['backend']): r for r in baseline['results']}
+    print('{:<24} {:<8} {:>14} {:>14} {:>8}'.format('case', 'backend', 'before rows/s', 'after rows/s', 'ratio'),
+          file=sys.stderr)
+    for r in results:
+        b = before.get((r['case'], r['backend']))
+        if b is None or not b['rows_per_sec'] or not r['rows_per_sec']:
+            continue
+        ratio = r['rows_per_sec'] / b['rows_per_sec']
+        print('{:<24} {:<8} {:>14.1f} {:>14.1f} {:>8.2f}'.format(
+            r['case'], r['backend'] or '-', b['rows_per_sec'], r['rows_per_sec'], ratio), file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='Benchmark dustbunny generation throughput.')
+    parser.add_argument('--case', action='append', choices=sorted(CASES), help='case to run (default: all)')
+    parser.add_argument('--backend', action='append', choices=sorted(BACKENDS), help='SQLite backend (default: all)')
+    parser.add_argument('--size', type=int, default=1000, help='roughly how many rows each case generates')
+    parser.add_argument('--repeat', type=int, default=1, help='how many times to run each case')
+    parser.add_argument('--output', help='write JSON results here (default: stdout)')
+    parser.add_argument('--compare', help='a previous JSON result to compare rows/sec against')
+    args = parser.parse_args(argv)
+
+    results = []
+    for name in args.case or sorted(CASES):
+        _, needs_db = CASES[name]
+        for backend in (args.backend or sorted(BACKENDS)) if needs_db else [None]:
+            for _ in range(args.repeat):
+                result = _run_isolated(name, backend, args.size)
+                print('{case:<24} {b:<8} {rows:>8} rows {rows_per_sec:>12.1f} rows/s {peak_rss_kb:>8} KB'.format(
+                    b=backend or '-', **result), file=sys.stderr)
+                results.append(result)
+
+    report = {
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'dustbunny': _source(),
+        'versions': {dist: _version(dist) for dist in ('hypothesis', 'sqlalchemy', 'numpy')},
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            _compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Benchmark cases. Each case does its setup and returns a zero-argument callable; only that callable is timed. The
+callable returns the number of rows (or values) it produced.
+"""
+
+import datetime as dt
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from hypothesis import given, settings, strategies as st
+
+from dustbunny import Generate
+from dustbunny.perms import AllPerms, SomePerms
+from dustbunny.hyp.strategies import gfywords, alphanumeric, datetimes_in_range
+
+from .models import DB, Flat, Parent, Child, Wide, WIDE_COLUMNS, add_to_session
+
+try:
+    from dustbunny import depends_on
+except ImportError:  # releases before Generate.compile(); relative values are just called with everything
+    def depends_on(*names):
+        return lambda func: func
+
+# don't read or write an example database: replayed examples would make runs incomparable
+settings.register_profile('benchmarks', database=None)
+settings.load_profile('benchmarks')
+
+START = dt.datetime(2017, 1, 1)
+END = dt.datetime(2018, 1, 1)
+
+BACKENDS = {
+    'memory': lambda path: 'sqlite://',
+    'file': lambda path: 'sqlite:///' + path,
+}
+
+
+def execute_flat(db, size):
+    gen = Generate(db, Flat, create_func=add_to_session(db), deadline=None)\
+        .num(size)\
+        .using(
+            name=gfywords(),
+            code=alphanumeric(min_size=1, max_size=8),
+            amount=st.floats(min_value=0, max_value=1000),
+            created=datetimes_in_range(allow_naive=True, timezones=[], start_date=START, end_date=END),
+        ).with_fixed_values_for(
+            active=True
+        )
+    return lambda: len(gen.execute())
+
+
+def execute_parent_child(db, size):
+    parents = Generate(db, Parent, create_func=add_to_session(db), deadline=None)\
+        .num(max(size // 10, 1))\
+        .using(name=gfywords())\
+        .execute()
+
+    gen = Generate(db, Child, create_func=add_to_session(db), deadline=None)\
+        .num(5)\
+        .for_every(
+            ('parent', parents),
+            ('kind', range(2)),
+        ).using(
+            label=gfywords()
+        )
+    return lambda: len(gen.execute())
+
+
+def _following(name):
+    @depends_on(name)
+    def value(**k):
+        return k[name] + 1
+    return value
+
+
+def execute_wide(db, size):
+    half = WIDE_COLUMNS // 2
+    gen = Generate(db, Wide, create_func=add_to_session(db), deadline=None)\
+        .num(size)\
+        .using(seed=st.integers(min_value=0, max_value=1000))\
+        .with_relative_values_for(**{'c{}'.format(i): _following('seed') for i in range(half)})
+    for i in range(half, WIDE_COLUMNS):
+        gen = gen.with_relative_values_for(**{'c{}'.format(i): _following('c{}'.format(i - 1))})
+    return lambda: len(gen.execute())
+
+
+def remove(db, size):
+    gen = Generate(db, Flat, create_func=add_to_session(db), deadline=None)\
+        .num(size)\
+        .using(name=gfywords())
+    gen.execute()
+
+    def run():
+        gen.remove()
+        return len(gen.generated_instances)
+    return run
+
+
+def _perm_args(size):
+    return ('a', range(max(size // 100, 1))), ('b', range(10)), ('c', range(10))
+
+
+def all_perms(db, size):
+    perms = AllPerms(*_perm_args(size))
+    return lambda: sum(1 for _ in perms)
+
+
+def some_perms(db, size):
+    perms = SomePerms(*_perm_args(size), from_n=size // 4)
+    return lambda: sum(1 for _ in perms)
+
+
+def _draw(strategy, size):
+    def run():
+        values = []
+
+        @settings(max_examples=size, deadline=None)
+        @given(strategy)
+        def draw(value):
+            values.append(value)
+
+        draw()
+        return len(values)
+    return run
+
+
+def gfywords_(db, size):
+    return _draw(gfywords(), size)
+
+
+def datetimes_in_range_(db, size):
+    # datetimes_in_range draws from `random` rather than from Hypothesis, so on its own Hypothesis sees every example
+    # as the same one and stops after the first. Pair it with an integer so that each example is distinct.
+    strategy = datetimes_in_range(allow_naive=True, timezones=[], start_date=START, end_date=END)
+    return _draw(st.tuples(st.integers(), strategy), size)
+
+
+# name -> (case, needs a database)
+CASES = {
+    'execute_flat': (execute_flat, True),
+    'execute_parent_child': (execute_parent_child, True),
+    'execute_wide': (execute_wide, True),
+    'remove': (remove, True),
+    'all_perms': (all_perms, False),
+    'some_perms': (some_perms, False),
+    'gfywords': (gfywords_, False),
+    'datetimes_in_range': (datetimes_in_range_, False),
+}
+
+
+def peak_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss  # bytes on macOS, kilobytes elsewhere
+
+
+def run_case(name, backend, size):
+    """
+    Run a single case. Meant to be called in a fresh process so that the peak RSS belongs to this case alone.
+
+    :param name (str): a key of `CASES`
+    :param backend (str): a key of `BACKENDS`, or None for cases that don't use a database
+    :param size (int): roughly how many rows to generate
+    :return: dict
+    """
+    case, _ = CASES[name]
+    db = None
+    with tempfile.TemporaryDirectory() as tmp:
+        if backend is not None:
+            db = DB(BACKENDS[backend](os.path.join(tmp, 'bench.sqlite')))
+
+        run = case(db, size)
+        if db is not None:
+            db.commits = 0
+
+        start = time.perf_counter()
+        rows = run()
+        seconds = time.perf_counter() - start
+
+        commits = db.commits if db is not None else None
+        if db is not None:
+            db.close()
+
+    return {
+        'case': name,
+        'backend': backend,
+        'size': size,
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_sec': rows / seconds if seconds else None,
+        'peak_rss_kb': peak_rss_kb(),
+        'commits': commits,
+    }
@@ -0,0 +1,81 @@
+"""
+Representative models for the benchmarks: a flat table, a parent/child pair, and a wide table.
+"""
+
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, create_engine, event
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship, sessionmaker
+
+Base = declarative_base()
+
+WIDE_COLUMNS = 20
+
+
+class Flat(Base):
+    __tablename__ = 'flat'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(128))
+    code = Column(String(32))
+    amount = Column(Float)
+    active = Column(Boolean)
+    created = Column(DateTime)
+
+
+class Parent(Base):
+    __tablename__ = 'parent'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(128))
+
+
+class Child(Base):
+    __tablename__ = 'child'
+
+    id = Column(Integer, primary_key=True)
+    parent_id = Column(Integer, ForeignKey('parent.id'), nullable=False)
+    parent = relationship(Parent)
+    kind = Column(Integer)
+    label = Column(String(128))
+
+
+class Wide(Base):
+    __tablename__ = 'wide'
+
+    id = Column(Integer, primary_key=True)
+    seed = Column(Integer)
+
+
+for i in range(WIDE_COLUMNS):
+    setattr(Wide, 'c{}'.format(i), Column(Integer))
+
+
+class DB(object):
+    """
+    The smallest thing that looks like the `db` object `Generate` expects: something with a `session`. Also counts
+    the commits made on the session.
+    """
+    def __init__(self, url):
+        self.engine = create_engine(url)
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.commits = 0
+        event.listen(self.session, 'after_commit', self._count_commit)
+
+    def _count_commit(self, session):
+        self.commits += 1
+
+    def close(self):
+        self.session.close()
+        self.engine.dispose()
+
+
+def add_to_session(db):
+    """
+    A create function for `Generate.by_method` that adds plain model instances to the session without committing.
+    """
+    def create(M, **kwargs):
+        inst = M(**kwargs)
+        db.session.add(inst)
+        return inst
+    return create
@@ -1,3 +1,4 @@
 from .generate import Generate
+from .plan import Plan, depends_on
 from . import sqla
 from . import hyp
\ No newline at end of file
@@ -0,0 +1,370 @@
+"""
+Dataset Cache
+=============
+
+Replay generated records instead of generating them again. A `Plan` is hashed -- model table schema, fixtures,
+strategies, relative value code, parents, creation function and seed, along with the dustbunny, Hypothesis and
+numpy versions -- and the rows it generated are stored under that hash as a compressed, columnar numpy `.npz`
+file. The next time the same plan runs, the rows are loaded straight into the database and Hypothesis is never
+called.
+
+Autoincrement primary keys are not stored, so replayed rows get fresh ids from the database. Child plans whose
+parents are ORM instances hash those parents by identity, so a child dataset is only replayed onto the same parents.
+
+If part of a plan can't be described stably (an unsaved ORM instance, say), the plan runs without the cache.
+
+Cache files are unpickled when they are loaded; only point `cache_dir` at a directory you trust.
+"""
+
+import functools
+import hashlib
+import inspect
+import os
+import sys
+import sysconfig
+import tempfile
+import zipfile
+
+import hypothesis
+import numpy as np
+from hypothesis.strategies._internal import SearchStrategy
+from sqlalchemy import inspect as sqla_inspect
+from sqlalchemy.engine import Engine, Connection
+from sqlalchemy.orm import Session, scoped_session
+from sqlalchemy.orm.state import InstanceState
+
+from .perms import AllPerms, SomePerms
+
+FORMAT_VERSION = 3
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+_STDLIB = sysconfig.get_paths()['stdlib']
+
+
+class Unfingerprintable(TypeError):
+    """
+    Raised when a value has no stable description, so a plan using it can't be cached safely.
+    """
+
+
+def _version(dist):
+    try:
+        from importlib.metadata import version
+        return version(dist)
+    except Exception:
+        return None
+
+
+# the versions that decide what a plan generates, beyond the plan itself; library functions are only described by name
+VERSIONS = (('dustbunny', _version('dustbunny')), ('hypothesis', hypothesis.__version__), ('numpy', np.__version__))
+
+# attributes Hypothesis uses to cache things it works out from a strategy's arguments (checked against Hypothesis 5)
+_STRATEGY_CACHES = {
+    'validate_called', '_LazyStrategy__wrapped_strategy', '_LazyStrategy__representation',
+    '_OneOfStrategy__element_strategies', '_OneOfStrategy__in_branches', '_FilteredStrategy__condition',
+}
+
+
+def _is_database(value):
+    if isinstance(value, (Session, scoped_session, Engine, Connection)):
+        return True
+    return isinstance(getattr(value, 'session', None), (Session, scoped_session))
+
+
+def _is_library(func):
+    module = sys.modules.get(getattr(func, '__module__', None) or '')
+    path = getattr(module, '__file__', None) or ''
+    return 'site-packages' in path or 'dist-packages' in path or path.startswith(_STDLIB)
+
+
+def _code_fingerprint(code):
+    consts = tuple(_code_fingerprint(c) if inspect.iscode(c) else repr(c) for c in code.co_consts)
+    return code.co_code.hex(), consts, code.co_names
+
+
+def _global_names(code):
+    names = set(code.co_names)
+    for c in code.co_consts:
+        if inspect.iscode(c):
+            names |= _global_names(c)
+    return names
+
+
+def _function_fingerprint(func, seen):
+    closure = [fingerprint(cell.cell_contents, seen) for cell in (func.__closure__ or ()) if _has_contents(cell)]
+    defaults = fingerprint(func.__defaults__, seen), fingerprint(func.__kwdefaults__, seen)
+    if _is_library(func):  # the code is pinned by the installed version; only what it closes over can vary
+        return ('function', func.__module__, func.__qualname__, closure, defaults)
+
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        source = None
+
+    module_globals = func.__globals__
+    referenced = sorted(
+        (name, fingerprint(module_globals[name], seen))
+        for name in _global_names(func.__code__) if name in module_globals
+    )
+    return (
+        'function', func.__module__, func.__qualname__, source, _code_fingerprint(func.__code__),
+        closure, defaults, referenced, getattr(func, 'depends_on', None),
+    )
+
+
+def _has_contents(cell):
+    try:
+        cell.cell_contents
+    except ValueError:
+        return False
+    return True
+
+
+def _strategy_fingerprint(strategy, seen):
+    if hasattr(strategy, '_LazyStrategy__args'):
+        return ('strategy', fingerprint(strategy.function, seen), fingerprint(strategy._LazyStrategy__args, seen),
+                fingerprint(strategy._LazyStrategy__kwargs, seen))
+    elif type(strategy).__name__ == 'LazyStrategy':  # only its repr would be left, and that hides mapped functions
+        raise Unfingerprintable("Can't describe {!r} with this version of Hypothesis".format(strategy))
+
+    attrs = {k: v for k, v in vars(strategy).items() if k not in _STRATEGY_CACHES and not k.startswith('cached_')}
+    return ('strategy', type(strategy).__module__, type(strategy).__qualname__, fingerprint(attrs, seen))
+
+
+def _object_fingerprint(value, seen):
+    attrs = {}
+    if hasattr(value, '__dict__'):
+        attrs.update(vars(value))
+    for cls in type(value).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            if name not in ('__dict__', '__weakref__') and hasattr(value, name):
+                attrs[name] = getattr(value, name)
+
+    if not attrs and not hasattr(value, '__dict__'):
+        raise Unfingerprintable("Can't describe {!r} for the cache key".format(value))
+    return ('object', type(value).__module__, type(value).__qualname__, fingerprint(attrs, seen))
+
+
+def fingerprint(value, seen=None):
+    """
+    Build a stable description of a value: one that does not depend on memory addresses, so it is the same from one
+    process to the next. ORM instances are described by their identity key, Hypothesis strategies by their arguments,
+    functions by their code, closure and the globals they use, and other objects by their repr, or by their
+    attributes if the repr is the default one. The database and its session are left out.
+
+    :param value: anything
+    :return: a nested structure of tuples and strings.
+    :raises Unfingerprintable: if the value can't be described stably
+    """
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return ('cycle',)
+
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return value
+
+    state = sqla_inspect(value, raiseerr=False)
+    if isinstance(state, InstanceState):
+        if state.identity is None:
+            raise Unfingerprintable("{!r} hasn't been saved, so it has no identity".format(value))
+        return ('instance', type(value).__name__, state.identity)
+    elif _is_database(value):
+        return ('database',)
+
+    seen = seen | {id(value)}
+    if isinstance(value, dict):
+        return ('dict', sorted((repr(fingerprint(k, seen)), fingerprint(v, seen)) for k, v in value.items()))
+    elif isinstance(value, (set, frozenset)):
+        return ('set', sorted(repr(fingerprint(v, seen)) for v in value))
+    elif isinstance(value, (list, tuple, range)):
+        return (type(value).__name__, [fingerprint(v, seen) for v in value])
+    elif isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return ('ndarray', value.shape, fingerprint(value.tolist(), seen))
+        return ('ndarray', value.dtype.str, value.shape, hashlib.sha256(value.tobytes()).hexdigest())
+    elif isinstance(value, SearchStrategy):
+        return _strategy_fingerprint(value, seen)
+    elif isinstance(value, SomePerms):
+        return (type(value).__name__, fingerprint(value.of, seen), value.from_n, value.to_n,
+                fingerprint(value.dist, seen))
+    elif isinstance(value, AllPerms):
+        return (type(value).__name__, fingerprint(value.of, seen))
+    elif isinstance(value, functools.partial):
+        return ('partial', fingerprint(value.func, seen), fingerprint(value.args, seen),
+                fingerprint(value.keywords, seen))
+    elif inspect.ismodule(value):
+        return ('module', value.__name__)
+    elif inspect.isclass(value):
+        return ('class', value.__module__, value.__qualname__)
+    elif inspect.ismethod(value):
+        return ('method', fingerprint(value.__self__, seen), fingerprint(value.__func__, seen))
+    elif inspect.isfunction(value):
+        return _function_fingerprint(value, seen)
+    elif inspect.isbuiltin(value) or inspect.ismethoddescriptor(value):
+        return ('builtin', getattr(value, '__module__', None), value.__qualname__)
+
+    r = repr(value)
+    if ' at 0x' in r:  # the default repr
+        return _object_fingerprint(value, seen)
+    return r
+
+
+def _schema(table):
+    return [
+        (c.name, repr(c.type), c.nullable, c.primary_key, sorted(fk.target_fullname for fk in c.foreign_keys))
+        for c in table.columns
+    ]
+
+
+def _stored_columns(mapper):
+    table = mapper.local_table
+    autoincrement = getattr(table, 'autoincrement_column', None)
+    if autoincrement is None:
+        autoincrement = getattr(table, '_autoincrement_column', None)
+
+    columns = []
+    for column in table.columns:
+        if column is autoincrement:
+            continue
+        try:
+            columns.append(mapper.get_property_by_column(column).key)
+        except Exception:
+            continue
+    return columns
+
+
+def _to_array(values):
+    try:
+        arr = np.asarray(values)
+    except ValueError:  # ragged sequences
+        arr = None
+    if arr is not None and arr.ndim == 1 and arr.dtype.kind in 'biuf':
+        return arr
+
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = values
+    return arr
+
+
+class DatasetCache(object):
+    """
+    A directory of cached datasets, evicted least-recently-used first once it grows past `max_bytes`.
+
+    :param cache_dir (str): where to keep the cached datasets; created if it doesn't exist.
+    :param max_bytes (int): the most space the cache may use.
+    """
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, plan):
+        """
+        The content address of the dataset a plan generates.
+
+        :param plan (Plan): a compiled generator
+        :return: str
+        :raises Unfingerprintable: if part of the plan can't be described stably
+        """
+        parts = (
+            FORMAT_VERSION,
+            VERSIONS,
+            plan.model.__name__,
+            _schema(plan.model.__table__),
+            fingerprint(dict(plan.fixtures)),
+            fingerprint(dict(plan.strategy)),
+            fingerprint(dict(plan.extras)),
+            [(name, fingerprint(xform), arg_names) for name, xform, arg_names in plan.steps],
+            fingerprint(plan.parents),
+            fingerprint(plan.create),
+            plan.n,
+            fingerprint(plan.dist),
+            plan.seed,
+        )
+        return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def load(self, key, plan):
+        """
+        Load a cached dataset into the database.
+
+        :param key (str): from `key()`
+        :param plan (Plan): the plan the dataset was generated by
+        :return: a list of the loaded instances, or None if the dataset isn't cached.
+        """
+        path = self.path(key)
+        try:
+            with np.load(path, allow_pickle=True) as data:
+                columns = [str(c) for c in data['__columns__']]
+                values = [data['c{}'.format(i)].tolist() for i in range(len(columns))]
+                n = int(data['__rows__'])
+        except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+            return None
+
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+
+        manager = sqla_inspect(plan.model).class_manager
+        recs = []
+        for row in range(n):
+            inst = manager.new_instance()
+            for attr, column in zip(columns, values):
+                setattr(inst, attr, column[row])
+            recs.append(inst)
+
+        plan.db.session.add_all(recs)
+        plan.db.session.commit()
+        return recs
+
+    def store(self, key, plan, recs):
+        """
+        Save the rows of a set of generated instances, then evict old datasets if the cache is too big.
+
+        :param key (str): from `key()`
+        :param plan (Plan): the plan that generated the instances
+        :param recs (list): the generated instances
+        :return: None
+        """
+        columns = _stored_columns(sqla_inspect(plan.model))
+        arrays = {'c{}'.format(i): _to_array([getattr(r, attr) for r in recs]) for i, attr in enumerate(columns)}
+        arrays['__columns__'] = np.array(columns, dtype=object)
+        arrays['__rows__'] = np.array(len(recs))
+
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used datasets until the cache fits in `max_bytes`.
+
+        :return: None
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                try:
+                    st = os.stat(os.path.join(self.cache_dir, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            total -= size
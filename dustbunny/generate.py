@@ -1,8 +1,8 @@
-import itertools
 import copy
 from .perms import AllPerms, SomePerms
-from hypothesis import given, settings
-from io import StringIO
+from .plan import Plan
+from .cache import DEFAULT_CACHE_SIZE
+from .infer import infer_from_table
 
 
 class Generate(object):
@@ -28,12 +28,24 @@ class Generate(object):
         self.model = model
         self.n = 200
         self.dist = None
+        self.explicit_num = False
         self.strategy = {}
+        self.inferred = {}
+        self.inferred_num = None
+        self.inferred_per = None
         self.fixtures = {}
         self.relative_values = []
         self.extras = {}
         self.generated_instances = []
         self.deadline = deadline
+        self.seed = None
+        self._plan = None  # compiled for _do; every combinator works on a copy, which compiles its own
+
+    def __copy__(self):
+        ret = type(self).__new__(type(self))
+        ret.__dict__.update(self.__dict__)
+        ret._plan = None
+        return ret
 
     def with_extras(self, **kwargs):
         """
@@ -54,16 +66,39 @@ class Generate(object):
         ret.create = create_func
         return ret
             
-    def execute(self):
+    def compile(self):
+        """
+        Compile the generator into an immutable, reusable `Plan`. Fixtures are frozen, relative values are put in
+        dependency order, and the per-record argument layout is worked out once rather than for every record.
+        
+        :return: Plan
+        """
+        return Plan(self)
+
+    def with_seed(self, seed):
+        """
+        Seed Hypothesis, and the inferred number of children per parent, so that the same generator produces the same
+        records every time.
+        
+        :param seed (int): the random seed
+        :return: Generate
+        """
+        ret = copy.copy(self)
+        ret.seed = seed
+        return ret
+
+    def execute(self, cache_dir=None, cache_size=DEFAULT_CACHE_SIZE):
         """
         Actually run the generation script.
         
+        :param cache_dir (str): Opt in to caching the generated records in this directory. If the same generator
+            (same schema, fixtures, strategies, relative values, parents and seed) has run before, its records are
+            loaded straight into the database instead of being generated again. 
+        :param cache_size (int): The most space, in bytes, the cache may use before the least recently used
+            datasets are evicted.
         :return: a list of generated instances.
         """
-        if self.parents is None:
-            self.generated_instances.extend(self._do())
-        else:
-            self.generated_instances.extend(list(itertools.chain(*(self._do(**p) for p in self.parents))))
+        self.generated_instances.extend(self.compile().execute(cache_dir=cache_dir, cache_size=cache_size))
         return self.generated_instances
         
     def remove(self):
@@ -77,29 +112,9 @@ class Generate(object):
         self.db.session.commit()
                 
     def _do(self, **parents):
-        if self.dist is not None:
-            k = self.dist(1)[0]
-            if k == 0:
-                k = 1
-        else:
-            k = self.n
-            
-        recs = []
-            
-        @settings(max_examples=k, deadline=self.deadline)
-        def gen(**kwargs):
-            rels = {}
-            for rv in self.relative_values:
-                rels.update({name: xform(**kwargs, **parents, **self.fixtures, **rels, **self.extras) for name, xform in rv.items()})
-            recs.append(self.create(self.model, **kwargs, **parents, **self.fixtures, **rels))
-        
-        if self.strategy:    
-            given(**self.strategy)(gen)()
-        else:
-            gen()
-            
-        self.db.session.commit()
-        return recs
+        if self._plan is None:
+            self._plan = self.compile()
+        return self._plan.run(**parents)
     
     def num(self, n=None, dist=None):
         """
@@ -114,6 +129,7 @@ class Generate(object):
         
         ret.n = n
         ret.dist = dist
+        ret.explicit_num = True
         
         return ret
 
@@ -163,6 +179,42 @@ class Generate(object):
         """
         return self.using(**strategy)
     
+    def infer_from(self, db, sample_rows=1000, per=None, max_categories=64, bins=32):
+        """
+        Use random values drawn from the distributions of an existing copy of the model's table, such as a local
+        SQLite copy of production data. One bounded sample of the table is profiled into a histogram or frequency 
+        table per column, including how often each column is NULL. Values set with `using`, `with_fixed_values_for`, 
+        `with_relative_values_for` or by parents always take precedence over inferred ones.
+        
+        Primary and foreign key columns are not inferred. Instead, the number of children each parent has is
+        sampled for each foreign key, and used as the distribution for `num` when generating for parents (set with
+        `for_every` or `for_some`), or whenever `per` is given. An explicit `num` always wins.
+        
+        :param db: An object with a SQLAlchemy `session`, connected to the database to sample 
+        :param sample_rows (int): The most rows to sample
+        :param per (str): The foreign key attribute whose children-per-parent counts set the number of instances to 
+            generate. Defaults to the only foreign key, if the table has exactly one, and then only applies to
+            generators with parents.
+        :param max_categories (int): Columns with at most this many distinct values use a frequency table, even if
+            they are numeric. 
+        :param bins (int): The most histogram bins to use for a column
+        :return: Generate
+        :raises ValueError: if `per` isn't a foreign key with any parents to count children for
+        """
+        profiles, children = infer_from_table(
+            db, self.model, sample_rows=sample_rows, max_categories=max_categories, bins=bins)
+        if per is not None and per not in children:
+            raise ValueError("Can't count children per '{}': {} has no foreign key by that name with any parents. "
+                             "Choose from: {}".format(per, self.model.__name__, ', '.join(sorted(children)) or 'none'))
+        
+        ret = copy.copy(self)
+        ret.inferred = {name: profile.strategy() for name, profile in profiles.items()}
+        ret.inferred_per = per
+        if per is None and len(children) == 1:
+            per = next(iter(children))
+        ret.inferred_num = children[per] if per is not None else None
+        return ret
+
     def with_fixed_values_for(self, **fixtures):
         """
         Use fixed values for the given set of attributes.
@@ -183,7 +235,8 @@ class Generate(object):
         
         :param kwargs (attr_name -> function): A mapping of attibute names to functions of a single dictionary argument
             containing all values already set for any given record so far.  Fixed, random, and "extra" values. The 
-            function should return the value you wnat to use for the attribute for that record.
+            function should return the value you wnat to use for the attribute for that record. The attributes a
+            function reads are traced when the generator is compiled; use `depends_on` to declare them instead.
             
         :return: Generate
         """
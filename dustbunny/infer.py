@@ -0,0 +1,291 @@
+"""
+Inferred Strategies
+===================
+
+Derive Hypothesis strategies from the data already in a table, so generated records have the same distributions,
+NULL rates and children-per-parent counts as the source. One bounded, random sample of the table is profiled per column
+into a frequency table (for low-cardinality columns), a histogram (for numbers, dates and datetimes) or a text profile
+of lengths and characters (for other text), so sampled values are only repeated where the source repeats them.
+
+Each profile is a precomputed inverse CDF held in plain lists, searched with `bisect`. Its strategy draws eight bytes
+from Hypothesis and hashes them, salted per profile, into a uniform number that it maps through the inverse CDF. The
+hash keeps the draw uniform even though Hypothesis favours simple byte strings, and everything is derived from the
+Hypothesis data, so profiles hold no state and seeded runs reproduce.
+"""
+
+import abc
+import bisect
+import datetime as dt
+import hashlib
+import math
+import numbers
+
+import numpy as np
+from hypothesis import strategies as st
+from sqlalchemy import func, Index, UniqueConstraint
+
+RESOLUTION = 2 ** 53
+EPOCH = dt.datetime(1970, 1, 1)
+
+
+class ColumnProfile(abc.ABC):
+    """
+    Base class for column profiles. Subclasses set up their distribution, then call this `__init__`, and implement
+    `_value(u)`, mapping a uniform number in `[0, 1)` to a value.
+
+    :param null_rate (float): the fraction of sampled values that were NULL
+    """
+    def __init__(self, null_rate):
+        self.null_rate = null_rate
+        self._salt = hashlib.blake2b(self._digest().encode('utf-8'), digest_size=16).digest()
+
+    @abc.abstractmethod
+    def _value(self, u):
+        pass
+
+    @abc.abstractmethod
+    def _digest(self):
+        pass
+
+    def sample(self, u):
+        """
+        Map a uniform number in `[0, 1)` to a value with the profiled distribution.
+        """
+        if u < self.null_rate:
+            return None
+        return self._value((u - self.null_rate) / (1 - self.null_rate))
+
+    def _sample_bytes(self, b):
+        h = hashlib.blake2b(b, digest_size=8, salt=self._salt).digest()
+        return self.sample((int.from_bytes(h, 'big') >> 11) / RESOLUTION)
+
+    def strategy(self):
+        """
+        :return: a Hypothesis strategy that draws values with the profiled distribution.
+        """
+        return st.binary(min_size=8, max_size=8).map(self._sample_bytes)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, self._digest())
+
+
+class Frequencies(ColumnProfile):
+    """
+    Sample from the values that were observed, weighted by how often they were observed.
+
+    :param values (list): the distinct non-NULL values
+    :param counts (list): how often each value was observed
+    :param null_rate (float): the fraction of sampled values that were NULL
+    """
+    def __init__(self, values, counts, null_rate=0.0):
+        self.values = list(values)
+        self.cdf = (np.cumsum(counts, dtype=float) / np.sum(counts)).tolist()
+        super(Frequencies, self).__init__(null_rate)
+
+    def _value(self, u):
+        return self.values[min(bisect.bisect_right(self.cdf, u), len(self.values) - 1)]
+
+    def _digest(self):
+        return hashlib.sha1(repr((self.values, self.cdf, self.null_rate)).encode('utf-8')).hexdigest()
+
+
+class Histogram(ColumnProfile):
+    """
+    Sample uniformly within histogram bins, choosing bins by their weight.
+
+    :param edges (list): the bin edges, as numbers
+    :param counts (list): how many values fell in each bin
+    :param kind (str): how to turn numbers back into values: 'int', 'float', 'date' or 'datetime'
+    :param null_rate (float): the fraction of sampled values that were NULL
+    """
+    def __init__(self, edges, counts, kind, null_rate=0.0):
+        self.edges = [float(e) for e in edges]
+        self.cum = [0.0] + (np.cumsum(counts, dtype=float) / np.sum(counts)).tolist()
+        self.kind = kind
+        super(Histogram, self).__init__(null_rate)
+
+    def _value(self, u):
+        i = min(max(bisect.bisect_right(self.cum, u) - 1, 0), len(self.edges) - 2)
+        lo, hi = self.cum[i], self.cum[i + 1]
+        x = self.edges[i]
+        if hi > lo:
+            x += (u - lo) / (hi - lo) * (self.edges[i + 1] - self.edges[i])
+
+        if self.kind == 'float':
+            return x
+        x = min(int(math.floor(x)), int(self.edges[-1]) - 1)  # the last edge is max + 1
+        if self.kind == 'int':
+            return x
+        elif self.kind == 'date':
+            return dt.date.fromordinal(x)
+        else:
+            return EPOCH + dt.timedelta(seconds=x)
+
+    def _digest(self):
+        return hashlib.sha1(repr((self.kind, self.edges, self.cum, self.null_rate)).encode('utf-8')).hexdigest()
+
+
+class Text(ColumnProfile):
+    """
+    Make up strings with the observed lengths from the observed characters, for text columns with too many distinct
+    values to sample from directly. The sampled values themselves are never repeated.
+
+    :param lengths (ColumnProfile): the profile of the string lengths
+    :param alphabet (str): the characters that were observed
+    :param null_rate (float): the fraction of sampled values that were NULL
+    """
+    def __init__(self, lengths, alphabet, null_rate=0.0):
+        self.lengths = lengths
+        self.alphabet = ''.join(sorted(set(alphabet)))
+        super(Text, self).__init__(null_rate)
+
+    def _value(self, u):
+        length = self.lengths._value(u)
+        chars = hashlib.shake_256(repr(u).encode('utf-8') + self._salt).digest(length)
+        return ''.join(self.alphabet[c % len(self.alphabet)] for c in chars)
+
+    def _digest(self):
+        return hashlib.sha1(repr((self.lengths._digest(), self.alphabet, self.null_rate)).encode('utf-8')).hexdigest()
+
+
+class ChildCounts(object):
+    """
+    A `dist` for `Generate.num` that draws how many children to make for a parent from the observed counts. A parent
+    with no children is a real observation, so unlike other distributions, a draw of 0 makes no records.
+
+    :param counts (list): the number of children each sampled parent has
+    """
+    def __init__(self, counts):
+        self.counts = np.asarray(counts, dtype=int)
+
+    def __call__(self, size, random_state=None):
+        """
+        :param size (int): how many counts to draw
+        :param random_state (numpy.random.RandomState): where to draw them from; numpy's global state by default
+        :return: a list of counts
+        """
+        return (random_state or np.random).choice(self.counts, size).tolist()
+
+    def __repr__(self):
+        return 'ChildCounts({})'.format(hashlib.sha1(self.counts.tobytes()).hexdigest())
+
+
+def _kind(values):
+    if all(isinstance(v, bool) for v in values):
+        return None
+    elif all(isinstance(v, numbers.Integral) for v in values):
+        return 'int'
+    elif all(isinstance(v, numbers.Real) for v in values):
+        return 'float'
+    elif all(isinstance(v, dt.datetime) and v.tzinfo is None for v in values):
+        return 'datetime'
+    elif all(isinstance(v, dt.date) and not isinstance(v, dt.datetime) for v in values):
+        return 'date'
+    return None
+
+
+def _as_numbers(values, kind):
+    if kind == 'datetime':
+        return np.array([(v - EPOCH).total_seconds() for v in values])
+    elif kind == 'date':
+        return np.array([v.toordinal() for v in values])
+    return np.array(values, dtype=float)
+
+
+def profile_column(values, max_categories=64, bins=32):
+    """
+    Profile one column of a sample.
+
+    :param values (list): the sampled values, including NULLs
+    :param max_categories (int): columns with at most this many distinct values get a frequency table even if they
+        are numeric. Text columns with more get made-up text, and other columns with more aren't profiled.
+    :param bins (int): the most histogram bins to use
+    :return: ColumnProfile, or None if every sampled value was NULL or the column can't be profiled
+    """
+    present = [v for v in values if v is not None]
+    if not present:
+        return None
+    null_rate = 1 - len(present) / len(values)
+
+    kind = _kind(present)
+    try:
+        distinct = {}
+        for v in present:
+            distinct[v] = distinct.get(v, 0) + 1
+    except TypeError:  # unhashable values
+        distinct = None
+
+    if distinct is not None and len(distinct) <= max_categories:
+        return Frequencies(list(distinct), list(distinct.values()), null_rate)
+    elif distinct is None and len(present) <= max_categories:
+        return Frequencies(present, [1] * len(present), null_rate)
+    elif kind is None:
+        # too many distinct values to sample from without copying them; make up text of the same shape instead
+        if all(isinstance(v, str) for v in present):
+            lengths = profile_column([len(v) for v in present], max_categories=max_categories, bins=bins)
+            return Text(lengths, ''.join(present), null_rate)
+        return None
+
+    x = _as_numbers(present, kind)
+    if kind == 'float':
+        counts, edges = np.histogram(x, bins=min(bins, len(distinct)))
+    else:
+        lo, hi = np.floor(x.min()), np.floor(x.max()) + 1
+        counts, edges = np.histogram(x, bins=int(min(bins, hi - lo)), range=(lo, hi))
+    return Histogram(edges, counts, kind, null_rate)
+
+
+def _unique_columns(table):
+    unique = {c.key for c in table.columns if c.unique}
+    for constraint in list(table.constraints) + [i for i in table.indexes if i.unique]:
+        if isinstance(constraint, (UniqueConstraint, Index)) and len(constraint.columns) == 1:
+            unique.update(c.key for c in constraint.columns)
+    return unique
+
+
+def infer_from_table(db, model, sample_rows=1000, max_categories=64, bins=32):
+    """
+    Sample a model's table and profile it.
+
+    Primary key and unique columns aren't profiled, since sampled values would soon repeat, and neither are foreign
+    key columns, since their values should come from parents. Instead, for every foreign key column, a random sample
+    of the referenced rows is taken and their children counted, so parents without children count as zero.
+
+    :param db: an object with a SQLAlchemy `session`, connected to the database to sample
+    :param model: the ORM model whose table to sample
+    :param sample_rows (int): the most rows to read for the profiles, and the most parents to count children for
+    :param max_categories (int): see `profile_column`
+    :param bins (int): see `profile_column`
+    :return: a tuple of (attribute name -> ColumnProfile, foreign key attribute name -> ChildCounts)
+    """
+    mapper = model.__mapper__
+    table = mapper.local_table
+    unique = _unique_columns(table)
+    columns = [c for c in table.columns if not (c.primary_key or c.foreign_keys or c.key in unique)]
+    rows = []
+    if columns:
+        rows = db.session.query(*columns).order_by(func.random()).limit(sample_rows).all()
+
+    profiles = {}
+    if rows:
+        for i, column in enumerate(columns):
+            profile = profile_column([row[i] for row in rows], max_categories=max_categories, bins=bins)
+            if profile is not None:
+                profiles[mapper.get_property_by_column(column).key] = profile
+
+    children = {}
+    for column in table.columns:
+        if column.foreign_keys:
+            parent = next(iter(column.foreign_keys)).column
+            child = table.alias()  # aliased, so a table referencing itself joins to a separate copy
+            counts = db.session.query(func.count(child.c[column.key]))\
+                .select_from(parent.table)\
+                .outerjoin(child, child.c[column.key] == parent)\
+                .group_by(parent)\
+                .order_by(func.random())\
+                .limit(sample_rows)\
+                .all()
+            if counts:
+                children[mapper.get_property_by_column(column).key] = ChildCounts([c for c, in counts])
+
+    return profiles, children
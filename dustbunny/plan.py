@@ -0,0 +1,410 @@
+import dis
+import heapq
+import inspect
+import threading
+import warnings
+from types import MappingProxyType
+import numpy as np
+from hypothesis import given, settings, seed
+from .cache import DatasetCache, DEFAULT_CACHE_SIZE, Unfingerprintable
+from .infer import ChildCounts
+
+
+def depends_on(*names):
+    """
+    Declare the attributes a relative value function reads, so a compiled plan doesn't have to trace it::
+
+        @depends_on('appt_date', 'wage_minutes')
+        def end_date(**k):
+            return k['appt_date'] + timedelta(minutes=k['wage_minutes'])
+
+    :param names (str): the attribute names the function reads
+    :return: a decorator that records the names on the function
+    """
+    def decorator(func):
+        func.depends_on = tuple(names)
+        return func
+    return decorator
+
+
+def _is_subscript(instr):
+    return instr.opname == 'BINARY_SUBSCR' or (instr.opname == 'BINARY_OP' and instr.argrepr == '[]')
+
+
+def _is_string_const(instr):
+    return instr.opname == 'LOAD_CONST' and isinstance(instr.argval, str)
+
+
+# single loads of a local variable; anything else that touches the mapping (including the combined loads of 3.13+,
+# whose argval is a tuple of names) isn't understood, and the function falls back to seeing every value
+_LOADS = ('LOAD_FAST', 'LOAD_FAST_CHECK', 'LOAD_FAST_BORROW')
+
+
+def _references(instr, name):
+    return instr.argval == name or (isinstance(instr.argval, tuple) and name in instr.argval)
+
+
+def _keys_from_instructions(instrs, name):
+    """
+    Find the constant keys read from the mapping named `name` in a list of instructions: `k['x']`, `k.get('x')` and
+    `'x' in k`. Returns None if the mapping is used in any other way (passed along, iterated, reassigned...).
+    """
+    keys = []
+    for n, instr in enumerate(instrs):
+        if not _references(instr, name):
+            continue
+        elif instr.opname not in _LOADS or instr.argval != name:
+            return None
+
+        prev_ = instrs[n - 1] if n > 0 else None
+        next_ = instrs[n + 1] if n + 1 < len(instrs) else None
+        after = instrs[n + 2] if n + 2 < len(instrs) else None
+        if next_ is None:
+            return None
+        elif _is_string_const(next_) and after is not None and _is_subscript(after):
+            keys.append(next_.argval)
+        elif next_.opname in ('LOAD_METHOD', 'LOAD_ATTR') and next_.argval == 'get' \
+                and after is not None and _is_string_const(after):
+            keys.append(after.argval)
+        elif next_.opname == 'CONTAINS_OP' and prev_ is not None and _is_string_const(prev_):
+            keys.append(prev_.argval)
+        else:
+            return None
+
+    return tuple(keys)
+
+
+def _traced_keys(code, name):
+    """
+    Find the constant keys read from the `**name` mapping of a code object, or None if they can't be determined.
+    """
+    if name in code.co_cellvars:  # captured by a closure
+        return None
+
+    instrs = [i for i in dis.get_instructions(code) if i.opname not in ('CACHE', 'EXTENDED_ARG', 'NOP')]
+    return _keys_from_instructions(instrs, name)
+
+
+def trace_dependencies(func):
+    """
+    Work out which attributes a relative value function reads.
+
+    A `depends_on` declaration wins. Otherwise named parameters count as dependencies, and a `**kwargs` parameter is
+    traced once through the function's bytecode for constant-key lookups.
+
+    :param func (callable): a relative value function
+    :return: a tuple of attribute names, or None if they can't be determined
+    """
+    declared = getattr(func, 'depends_on', None)
+    if declared is not None:
+        return tuple(declared)
+
+    try:
+        params = inspect.signature(func).parameters.values()
+    except (TypeError, ValueError):
+        return None
+
+    named = tuple(p.name for p in params if p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY))
+    var_kw = [p.name for p in params if p.kind == p.VAR_KEYWORD]
+    if not var_kw:
+        return named
+
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return None
+
+    traced = _traced_keys(code, var_kw[0])
+    if traced is None:
+        return None
+    return named + tuple(k for k in traced if k not in named)
+
+
+# suffix for a relative value held back until the rest of its layer has read the old value
+_PENDING = '\0pending'
+
+
+def _pending(name):
+    return name + _PENDING
+
+
+def _restore(**k):
+    value, = k.values()
+    return value
+
+
+def _overwrites_cycle(traced, visible):
+    """
+    Whether the functions of one layer overwrite values that other functions of the layer read in a circle, so that
+    no order of the layer lets every function read the old values.
+
+    :param traced (list): `(name, func, reads)` for each function of the layer
+    :param visible (list): the names visible to the layer
+    """
+    names = [name for name, _, _ in traced]
+    overwrites = {
+        name: [other for other in names if other != name and other in visible and (reads is None or other in reads)]
+        for name, _, reads in traced
+    }
+
+    done, active = set(), set()
+
+    def cyclic(name):
+        if name in active:
+            return True
+        elif name in done:
+            return False
+        active.add(name)
+        found = any(cyclic(other) for other in overwrites[name])
+        active.discard(name)
+        done.add(name)
+        return found
+
+    return any(cyclic(name) for name in names)
+
+
+class Plan(object):
+    """
+    An immutable, compiled version of a `Generate` object, made by `Generate.compile()`. Fixtures, strategies and
+    extras are frozen, the relative value functions are put in dependency order, and each function is given the exact
+    set of attribute names it will be called with. Running the plan keeps a single argument layout per parent
+    permutation and updates it in place for every record, so it is cheap to run over many permutations. Nothing on
+    the plan changes after it is built, so it can be shared between threads; every run has its own layout. Parents
+    passed to `run` that weren't declared are laid out once per set of names, behind a lock.
+    """
+    __slots__ = (
+        'db', 'model', 'create', 'n', 'dist', 'deadline', 'seed', 'parents', 'parent_keys',
+        'strategy', 'fixtures', 'extras', 'relative_values', 'steps', 'record_keys', '_base', '_layouts', '_lock',
+    )
+
+    def __init__(self, generator):
+        fixtures = dict(generator.fixtures)
+        extras = dict(generator.extras)
+        parent_keys = tuple(pair[0] for pair in generator.parents.of) if generator.parents is not None else ()
+
+        # inferred strategies only fill in attributes that haven't been set explicitly
+        explicit = set(generator.strategy) | set(fixtures) | set(parent_keys)
+        explicit.update(name for rv in generator.relative_values for name in rv)
+        strategy = {k: v for k, v in generator.inferred.items() if k not in explicit}
+        strategy.update(generator.strategy)
+
+        # inferred child counts only apply without an explicit num, and to parents unless asked for by name
+        n, dist = generator.n, generator.dist
+        if generator.inferred_num is not None and not generator.explicit_num \
+                and (generator.parents is not None or generator.inferred_per is not None):
+            n, dist = None, generator.inferred_num
+
+        base = dict(extras)
+        base.update(fixtures)
+
+        set_ = super(Plan, self).__setattr__
+        set_('db', generator.db)
+        set_('model', generator.model)
+        set_('create', generator.create)
+        set_('n', n)
+        set_('dist', dist)
+        set_('deadline', generator.deadline)
+        set_('seed', generator.seed)
+        set_('parents', generator.parents)
+        set_('parent_keys', parent_keys)
+        set_('strategy', MappingProxyType(strategy))
+        set_('fixtures', MappingProxyType(fixtures))
+        set_('extras', MappingProxyType(extras))
+        set_('relative_values', tuple(MappingProxyType(dict(rv)) for rv in generator.relative_values))
+        set_('_base', MappingProxyType(base))
+
+        steps, record_keys = self._layout(parent_keys)
+        set_('steps', steps)
+        set_('record_keys', record_keys)
+        set_('_layouts', {(): (steps, record_keys)})  # undeclared parent keys -> layout
+        set_('_lock', threading.Lock())
+
+    def _layout(self, parent_keys):
+        """
+        Work out the ordered relative value steps and the attributes passed to the creation function, given the names
+        of the parent attributes.
+
+        :return: a tuple of (steps, record_keys)
+        """
+        given_names = list(dict.fromkeys(list(self.strategy) + list(parent_keys) + list(self.fixtures)))
+
+        steps = self._order(self.relative_values, given_names, list(self.extras))
+        rel_names = []
+        for name, _, _ in steps:
+            if name.endswith(_PENDING):
+                continue
+            elif name in given_names:
+                raise ValueError("Relative value '{}' is already set as a fixed, random or parent value".format(name))
+            if name not in rel_names:
+                rel_names.append(name)
+
+        return steps, tuple(given_names + rel_names)
+
+    def _layout_with(self, undeclared):
+        """
+        The layout for parents that weren't declared, worked out once per set of names.
+
+        :param undeclared (tuple): the names of the parent attributes that weren't declared
+        :return: a tuple of (steps, record_keys)
+        """
+        with self._lock:
+            layout = self._layouts.get(undeclared)
+            if layout is None:
+                layout = self._layouts[undeclared] = self._layout(self.parent_keys + undeclared)
+        return layout
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Plan is immutable; build a new one with Generate.compile()")
+
+    def __delattr__(self, key):
+        raise AttributeError("Plan is immutable; build a new one with Generate.compile()")
+
+    @staticmethod
+    def _order(layers, given_names, extra_names):
+        """
+        Flatten the relative value layers into a tuple of `(name, func, arg_names)` in dependency order.
+
+        Each function sees the same values it would see being evaluated layer by layer: everything fixed, random,
+        parent and extra, plus the values from earlier layers. Within those, it is only passed what it reads. A layer
+        whose functions read each other's old values (swapping two values, say) can't be ordered so that every read
+        comes before the overwrite, so its results are held under pending names and written back after the layer.
+        """
+        nodes = []  # (layer, name, func, reads, visible)
+        names = list(dict.fromkeys(extra_names + given_names))
+        for layer, rv in enumerate(layers):
+            traced = [(name, func, trace_dependencies(func)) for name, func in rv.items()]
+            if _overwrites_cycle(traced, names):
+                for name, func, reads in traced:
+                    nodes.append((2 * layer, _pending(name), func, reads, names))
+                    nodes.append((2 * layer + 1, name, _restore, (_pending(name),), [_pending(name)]))
+            else:
+                nodes.extend((2 * layer, name, func, reads, names) for name, func, reads in traced)
+            names = list(dict.fromkeys(names + list(rv)))
+
+        edges = [set() for _ in nodes]
+        indegree = [0] * len(nodes)
+
+        def edge(a, b):
+            if b not in edges[a]:
+                edges[a].add(b)
+                indegree[b] += 1
+
+        for i, (layer, _, _, reads, visible) in enumerate(nodes):
+            for j, (other_layer, other_name, _, _, _) in enumerate(nodes):
+                if i == j:
+                    continue
+                read = reads is None or other_name in reads
+                if other_layer < layer and read:
+                    edge(j, i)  # a value from an earlier layer must be computed first
+                elif other_layer >= layer and read and other_name in visible:
+                    edge(i, j)  # and must be read before a later layer overwrites it
+
+        ready = [i for i in range(len(nodes)) if indegree[i] == 0]
+        heapq.heapify(ready)
+        steps = []
+        while ready:
+            i = heapq.heappop(ready)
+            _, name, func, reads, visible = nodes[i]
+            arg_names = visible if reads is None else [k for k in reads if k in visible]
+            steps.append((name, func, tuple(arg_names)))
+            for j in edges[i]:
+                indegree[j] -= 1
+                if indegree[j] == 0:
+                    heapq.heappush(ready, j)
+
+        if len(steps) < len(nodes):
+            raise ValueError("Relative values have circular dependencies")
+        return tuple(steps)
+
+    def execute(self, cache_dir=None, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Run the plan once for every parent permutation (or once, if there are no parents).
+
+        :param cache_dir (str): if given, replay the records from a `DatasetCache` in this directory when the same
+            plan has run before, and store them there when it hasn't. Plans that can't be hashed stably, or whose
+            creation function doesn't return model instances, run uncached.
+        :param cache_size (int): the most space, in bytes, the cache may use before old datasets are evicted.
+        :return: a list of generated instances.
+        """
+        cache = None
+        if cache_dir is not None:
+            cache = DatasetCache(cache_dir, cache_size)
+            try:
+                key = cache.key(self)
+            except Unfingerprintable as e:
+                warnings.warn("Not caching this run: {}".format(e))
+                cache = None
+            else:
+                recs = cache.load(key, self)
+                if recs is not None:
+                    return recs
+
+        random_state = self._random_state()
+        if self.parents is None:
+            recs = self._run({}, random_state)
+        else:
+            recs = []
+            for p in self.parents:
+                recs.extend(self._run(p, random_state))
+
+        if cache is not None:
+            if all(isinstance(r, self.model) for r in recs):
+                cache.store(key, self, recs)
+            else:
+                warnings.warn("Not caching this run: the creation function didn't return {} instances".format(
+                    self.model.__name__))
+        return recs
+
+    def run(self, **parents):
+        """
+        Generate records for a single parent permutation.
+
+        :param parents: the parent attribute values to set on every record.
+        :return: a list of generated instances.
+        """
+        return self._run(parents, self._random_state())
+
+    def _random_state(self):
+        """
+        Where inferred child counts are drawn from: seeded along with Hypothesis if the plan has a seed, so that
+        seeded runs make the same number of records for every parent.
+        """
+        if self.seed is None:
+            return None
+        return np.random.RandomState(self.seed % 2 ** 32)
+
+    def _run(self, parents, random_state):
+        if isinstance(self.dist, ChildCounts):
+            k = self.dist(1, random_state)[0]
+            if k == 0:
+                return []
+        elif self.dist is not None:
+            k = self.dist(1)[0]
+            if k == 0:
+                k = 1
+        else:
+            k = self.n
+
+        # parents not declared with for_every or for_some still go on the record
+        steps, record_keys = self._layout_with(tuple(k for k in parents if k not in self.parent_keys))
+
+        recs = []
+        layout = dict(self._base)
+        layout.update(parents)
+
+        @settings(max_examples=k, deadline=self.deadline)
+        def gen(**kwargs):
+            layout.update(kwargs)
+            for name, xform, arg_names in steps:
+                layout[name] = xform(**{a: layout[a] for a in arg_names})
+            recs.append(self.create(self.model, **{a: layout[a] for a in record_keys}))
+
+        if self.strategy:
+            test = given(**self.strategy)(gen)
+            if self.seed is not None:
+                test = seed(self.seed)(test)
+            test()
+        else:
+            gen()
+
+        self.db.session.commit()
+        return recs
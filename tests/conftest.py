@@ -0,0 +1,68 @@
+import pytest
+from hypothesis import settings
+from sqlalchemy import Column, Integer, String, Date, ForeignKey, create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship, sessionmaker
+
+settings.register_profile('tests', database=None, deadline=None)
+settings.load_profile('tests')
+
+Base = declarative_base()
+
+
+class Record(Base):
+    __tablename__ = 'record'
+
+    id = Column(Integer, primary_key=True)
+    a = Column(Integer)
+    b = Column(Integer)
+    label = Column(String(64))
+    user = Column(String(64))
+
+
+class Parent(Base):
+    __tablename__ = 'parent'
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(64))
+    created = Column(Date)
+
+
+class Child(Base):
+    __tablename__ = 'child'
+
+    id = Column(Integer, primary_key=True)
+    parent_id = Column(Integer, ForeignKey('parent.id'), nullable=False)
+    parent = relationship(Parent)
+    label = Column(String(64))
+
+
+class Account(Base):
+    __tablename__ = 'account'
+
+    id = Column(Integer, primary_key=True)
+    email = Column(String(64), unique=True, nullable=False)
+    name = Column(String(64))
+
+
+class DB(object):
+    def __init__(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+
+
+def add_to_session(db):
+    def create(M, **kwargs):
+        inst = M(**kwargs)
+        db.session.add(inst)
+        return inst
+    return create
+
+
+@pytest.fixture
+def db():
+    db = DB()
+    yield db
+    db.session.close()
+    db.engine.dispose()
@@ -0,0 +1,144 @@
+import os
+import warnings
+
+import numpy as np
+from hypothesis import strategies as st
+
+from dustbunny import Generate, cache
+from dustbunny.cache import DatasetCache, fingerprint
+from dustbunny.plan import Plan
+
+from .conftest import DB, Parent, Child, Record, add_to_session
+
+
+class Cfg(object):
+    def __init__(self, v):
+        self.v = v
+
+
+def parents(db, *names):
+    ps = [Parent(name=name) for name in names]
+    db.session.add_all(ps)
+    db.session.commit()
+    return ps
+
+
+def key(tmpdir, gen):
+    return DatasetCache(str(tmpdir)).key(gen.compile())
+
+
+def children(db):
+    return Generate(db, Child, create_func=add_to_session(db)).num(3).with_seed(1)
+
+
+def records(db):
+    return Generate(db, Record, create_func=add_to_session(db)).num(3).with_seed(1)
+
+
+def test_sampled_from_different_instances(db, tmpdir):
+    a = parents(db, 'a1', 'a2')
+    b = parents(db, 'b1', 'b2')
+    assert key(tmpdir, children(db).using(parent=st.sampled_from(a))) != \
+        key(tmpdir, children(db).using(parent=st.sampled_from(b)))
+
+
+def test_closures_over_different_objects(db, tmpdir):
+    def labelled(cfg):
+        return records(db).using(a=st.integers()).with_relative_values_for(label=lambda **k: str(cfg.v))
+
+    first = labelled(Cfg('one')).execute(cache_dir=str(tmpdir))
+    second = labelled(Cfg('two')).execute(cache_dir=str(tmpdir))
+    assert {r.label for r in first} == {'one'}
+    assert {r.label for r in second} == {'two'}
+
+
+def test_different_maps(db, tmpdir):
+    plus_one, plus_two = st.integers().map(lambda x: x + 1), st.integers().map(lambda x: x + 2)
+    assert fingerprint(plus_one) != fingerprint(plus_two)
+    assert key(tmpdir, records(db).using(a=plus_one)) != key(tmpdir, records(db).using(a=plus_two))
+
+
+def test_large_arrays(db, tmpdir):
+    x, y = np.zeros(5000), np.zeros(5000)
+    y[2500] = 1
+    assert fingerprint(x) != fingerprint(y)
+
+
+def test_database_state_is_not_part_of_the_key(db, tmpdir):
+    gen = records(db).using(a=st.integers())
+    before = key(tmpdir, gen)
+    parents(db, 'p')
+    assert key(tmpdir, gen) == before
+    assert key(tmpdir, Generate(DB(), Record, create_func=add_to_session(db)).num(3).with_seed(1)
+               .using(a=st.integers())) == before
+
+
+def test_hit_replays_rows_without_generating(db, tmpdir, monkeypatch):
+    gen = records(db).num(5)\
+        .using(a=st.integers(min_value=0, max_value=100))\
+        .with_relative_values_for(b=lambda **k: k['a'] * 2)
+    first = [(r.a, r.b) for r in gen.execute(cache_dir=str(tmpdir))]
+
+    def fail(self, parents, random_state):
+        raise AssertionError('generated records on a cache hit')
+    monkeypatch.setattr(Plan, '_run', fail)
+    second = [(r.a, r.b) for r in gen.execute(cache_dir=str(tmpdir))[len(first):]]
+
+    assert second == first
+    assert db.session.query(Record).count() == 2 * len(first)
+
+
+def test_unsaved_instances_run_uncached(db, tmpdir):
+    gen = children(db).using(parent=st.sampled_from([Parent(name='unsaved')]), label=st.text())
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        recs = gen.execute(cache_dir=str(tmpdir))
+
+    assert recs
+    assert any('Not caching' in str(w.message) for w in caught)
+    assert not [f for f in os.listdir(str(tmpdir)) if f.endswith('.npz')]
+
+
+def test_creation_functions_that_dont_return_instances_run_uncached(db, tmpdir):
+    def create(M, **kwargs):
+        db.session.add(M(**kwargs))
+
+    gen = Generate(db, Record, create_func=create).num(5).using(a=st.integers(min_value=0, max_value=1000))
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        recs = gen.execute(cache_dir=str(tmpdir))
+
+    assert recs and all(r is None for r in recs)
+    assert db.session.query(Record).count() == len(recs)
+    assert any('Not caching' in str(w.message) for w in caught)
+    assert not [f for f in os.listdir(str(tmpdir)) if f.endswith('.npz')]
+
+
+def test_least_recently_used_are_evicted(db, tmpdir):
+    cache_dir = str(tmpdir)
+    records(db).with_fixed_values_for(a=1).execute(cache_dir=cache_dir)
+    size = sum(os.path.getsize(os.path.join(cache_dir, f)) for f in os.listdir(cache_dir))
+    records(db).with_fixed_values_for(a=2).execute(cache_dir=cache_dir, cache_size=size)
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_library_versions_are_part_of_the_key(tmpdir, monkeypatch):
+    gen = records(None).using(label=st.text())
+    before = key(tmpdir, gen)
+    monkeypatch.setattr(cache, 'VERSIONS', cache.VERSIONS[:1] + (('hypothesis', '0.0.0'),) + cache.VERSIONS[2:])
+    assert key(tmpdir, gen) != before
+
+
+def test_hypothesis_internals_the_key_relies_on():
+    # strategies are described through name-mangled Hypothesis internals; if these change, keys would stop
+    # telling strategies apart
+    lazy = st.integers(0, 5)
+    assert lazy.function.__name__ == 'integers'
+    assert (lazy._LazyStrategy__args, lazy._LazyStrategy__kwargs) == ((0, 5), {})
+
+    strategies = [lazy, lazy.map(str), lazy.filter(bool), st.one_of(lazy, st.text()), st.text()]
+    for s in strategies:
+        s.validate()
+        repr(s)
+    seen = {name for s in strategies for name in vars(s)}
+    assert cache._STRATEGY_CACHES <= seen
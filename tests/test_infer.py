@@ -0,0 +1,191 @@
+import datetime as dt
+import itertools
+
+import pytest
+from hypothesis import given, settings, seed
+
+from dustbunny import Generate
+from dustbunny.infer import ColumnProfile, Frequencies, Histogram, Text, ChildCounts, profile_column, infer_from_table
+
+from .conftest import Account, Parent, Child, add_to_session
+
+GRID = [i / 1000 for i in range(1000)]
+
+
+def draws(profile, n=200, seed_=1):
+    values = []
+
+    @seed(seed_)
+    @settings(max_examples=n)
+    @given(profile.strategy())
+    def draw(value):
+        values.append(value)
+
+    draw()
+    return values
+
+
+def test_frequencies_follow_counts():
+    profile = Frequencies(['a', 'b'], [3, 1], null_rate=0.5)
+    values = [profile.sample(u) for u in GRID]
+    assert values.count(None) == 500
+    assert values.count('a') == 375
+    assert values.count('b') == 125
+
+
+def test_histogram_stays_in_range():
+    profile = profile_column(list(range(1000)) + [None] * 1000)
+    assert isinstance(profile, Histogram)
+    values = [profile.sample(u) for u in GRID]
+    assert values.count(None) == 500
+    present = [v for v in values if v is not None]
+    assert min(present) == 0 and 990 <= max(present) <= 999
+    assert all(isinstance(v, int) for v in present)
+
+
+def test_histogram_of_dates():
+    start = dt.date(2017, 1, 1)
+    profile = profile_column([start + dt.timedelta(days=i) for i in range(365)])
+    values = [profile.sample(u) for u in GRID]
+    assert min(values) == start and max(values) <= dt.date(2017, 12, 31)
+
+
+def test_low_cardinality_numbers_use_frequencies():
+    assert isinstance(profile_column([1, 2, 2, 3]), Frequencies)
+
+
+def test_high_cardinality_text_isnt_copied():
+    source = ['name{}'.format(i) for i in range(500)]
+    profile = profile_column(source, max_categories=64)
+    assert isinstance(profile, Text)
+
+    values = {profile.sample(u) for u in GRID}
+    assert len(values) == len(GRID)
+    assert not values & set(source)
+    assert {len(v) for v in values} <= {5, 6, 7}
+    assert set(''.join(values)) <= set(''.join(source))
+
+
+def test_high_cardinality_values_that_arent_text_arent_profiled():
+    assert profile_column([bytes([i, j]) for i in range(10) for j in range(10)], max_categories=64) is None
+
+
+def test_strategy_draws_uniformly():
+    values = draws(Frequencies(['a', 'b'], [1, 1], null_rate=0.5), n=1000)
+    assert 0.4 < values.count(None) / len(values) < 0.6
+
+
+def test_seeded_draws_reproduce_and_leave_the_profile_alone():
+    profile = Frequencies(list(range(100)), [1] * 100)
+    before = dict(vars(profile))
+    assert draws(profile) == draws(profile)
+    assert vars(profile) == before
+
+
+def test_profiles_are_abstract():
+    with pytest.raises(TypeError):
+        ColumnProfile(0.0)
+
+
+def test_rows_are_sampled_from_the_whole_table(db):
+    start = dt.date(2017, 1, 1)
+    db.session.add_all(Parent(name=str(i), created=start + dt.timedelta(days=i)) for i in range(500))
+    db.session.commit()
+
+    profiles, _ = infer_from_table(db, Parent, sample_rows=100)
+    created = profiles['created']
+    assert dt.date.fromordinal(int(created.edges[0])) < start + dt.timedelta(days=60)
+    assert dt.date.fromordinal(int(created.edges[-1])) > start + dt.timedelta(days=440)
+
+
+def test_parents_without_children_are_counted(db):
+    parents = [Parent(name=str(i)) for i in range(4)]
+    db.session.add_all(parents)
+    db.session.add_all(Child(parent=parents[0], label='x') for _ in range(3))
+    db.session.add(Child(parent=parents[1], label='y'))
+    db.session.commit()
+
+    profiles, children = infer_from_table(db, Child)
+    assert set(profiles) == {'label'}
+    assert sorted(children['parent_id'].counts.tolist()) == [0, 0, 1, 3]
+
+
+def test_a_child_count_of_zero_makes_no_records(db):
+    parent = Parent(name='p')
+    db.session.add(parent)
+    db.session.commit()
+
+    plan = Generate(db, Child, create_func=add_to_session(db))\
+        .num(dist=ChildCounts([0]))\
+        .with_fixed_values_for(label='x')\
+        .compile()
+    assert plan.run(parent=parent) == []
+
+
+def _source_with_children(db):
+    parents = [Parent(name=str(i)) for i in range(3)]
+    db.session.add_all(parents)
+    db.session.add_all(Child(parent=parents[0], label=str(i)) for i in range(3))
+    db.session.commit()
+    return parents
+
+
+def test_child_counts_apply_to_parents(db):
+    parents = _source_with_children(db)
+    plan = Generate(db, Child).infer_from(db).for_every(('parent', parents)).compile()
+    assert plan.n is None and isinstance(plan.dist, ChildCounts)
+
+
+def test_child_counts_dont_apply_without_parents(db):
+    _source_with_children(db)
+    plan = Generate(db, Child).infer_from(db).compile()
+    assert plan.n == 200 and plan.dist is None
+
+    plan = Generate(db, Child).infer_from(db, per='parent_id').compile()
+    assert plan.n is None and isinstance(plan.dist, ChildCounts)
+
+
+def test_explicit_num_wins_over_child_counts(db):
+    parents = _source_with_children(db)
+    gen = Generate(db, Child, create_func=add_to_session(db))
+    for g in (gen.num(5).infer_from(db, per='parent_id'), gen.infer_from(db, per='parent_id').num(5)):
+        plan = g.for_every(('parent', parents[:1])).compile()
+        assert plan.n == 5 and plan.dist is None
+        assert len(plan.execute()) == 5
+
+
+def test_unknown_per_is_an_error(db):
+    _source_with_children(db)
+    with pytest.raises(ValueError, match="parent_id"):
+        Generate(db, Child).infer_from(db, per='parent')
+
+
+def test_unique_columns_are_left_to_using(db):
+    db.session.add_all(Account(email='{}@example.com'.format(i), name='name{}'.format(i)) for i in range(500))
+    db.session.commit()
+
+    profiles, _ = infer_from_table(db, Account, sample_rows=100)
+    assert set(profiles) == {'name'}
+
+    recs = Generate(db, Account, create_func=add_to_session(db))\
+        .infer_from(db, sample_rows=100)\
+        .with_relative_values_for(email=lambda n=itertools.count(), **k: 'new{}@example.com'.format(next(n)))\
+        .num(300)\
+        .execute()
+    assert len({r.email for r in recs}) == len(recs) > 1
+
+
+def test_seeded_child_counts_reproduce(db):
+    ps = [Parent(name=str(i)) for i in range(20)]
+    db.session.add_all(ps)
+    db.session.add_all(Child(parent=p, label=str(j)) for i, p in enumerate(ps) for j in range(i % 7))
+    db.session.commit()
+
+    gen = Generate(db, Child, create_func=add_to_session(db))\
+        .infer_from(db)\
+        .with_seed(5)\
+        .for_every(('parent', ps))
+    runs = [gen.compile().execute() for _ in range(3)]
+    counts = [[sum(1 for r in recs if r.parent is p) for p in ps] for recs in runs]
+    assert counts[0] == counts[1] == counts[2]
+    assert len(set(counts[0])) > 1
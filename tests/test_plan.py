@@ -0,0 +1,138 @@
+import threading
+
+import pytest
+from hypothesis import strategies as st
+
+from dustbunny import Generate
+from dustbunny import plan as plan_module
+
+from .conftest import Record, add_to_session
+
+
+def generate(db):
+    return Generate(db, Record, create_func=add_to_session(db))
+
+
+def test_relative_values_see_earlier_layers(db):
+    recs = generate(db).num(5)\
+        .using(a=st.integers(min_value=0, max_value=10))\
+        .with_fixed_values_for(label='x')\
+        .with_relative_values_for(b=lambda **k: k['a'] * 2)\
+        .with_relative_values_for(user=lambda **k: '{}-{}'.format(k['label'], k['b']))\
+        .execute()
+
+    assert recs
+    for r in recs:
+        assert r.b == r.a * 2
+        assert r.user == 'x-{}'.format(r.b)
+
+
+def test_redefinition_is_read_before_it_is_overwritten(db):
+    recs = generate(db).num(3)\
+        .using(a=st.integers(min_value=0, max_value=10))\
+        .with_relative_values_for(b=lambda **k: k['a'])\
+        .with_relative_values_for(label=lambda **k: str(k['b']), b=lambda **k: k['b'] + 100)\
+        .execute()
+
+    for r in recs:
+        assert r.b == r.a + 100
+        assert r.label == str(r.a)
+
+
+def test_layer_can_swap_values(db):
+    gen = generate(db).num(1)\
+        .with_relative_values_for(a=lambda **k: 1, b=lambda **k: 2)\
+        .with_relative_values_for(a=lambda **k: k['b'], b=lambda **k: k['a'])
+    rec, = gen.execute()
+    assert (rec.a, rec.b) == (2, 1)
+    assert gen.compile().record_keys == ('a', 'b')
+
+
+def test_layer_can_rotate_values_that_are_read_untraced(db):
+    def untraced(name):
+        return lambda **k: dict(k)[name]
+
+    rec, = generate(db).num(1)\
+        .with_relative_values_for(a=lambda **k: 1, b=lambda **k: 2, user=lambda **k: 'uuu')\
+        .with_relative_values_for(a=untraced('b'), b=lambda **k: len(k['user']), user=lambda **k: str(k['a']))\
+        .execute()
+    assert (rec.a, rec.b, rec.user) == (2, 3, '1')
+
+
+def test_run_passes_undeclared_parents_through(db):
+    plan = generate(db).num(1).with_fixed_values_for(a=0)\
+        .with_relative_values_for(label=lambda **k: k['user'].lower())\
+        .compile()
+
+    rec, = plan.run(user='U1')
+    assert (rec.a, rec.user, rec.label) == (0, 'U1', 'u1')
+
+
+def test_do_passes_parents_through(db):
+    rec, = generate(db).num(1).with_fixed_values_for(a=0)._do(user='U2')
+    assert rec.user == 'U2'
+
+
+def test_undeclared_parents_are_laid_out_once(db, monkeypatch):
+    plan = generate(db).num(1).with_fixed_values_for(a=0)\
+        .with_relative_values_for(label=lambda **k: k['user'].lower())\
+        .compile()
+
+    traced = []
+    monkeypatch.setattr(plan_module, 'trace_dependencies', lambda func: traced.append(func) or None)
+    for user in ('U1', 'U2', 'U3'):
+        rec, = plan.run(user=user)
+        assert rec.label == user.lower()
+    assert len(traced) == 1
+
+
+def test_do_compiles_once(db, monkeypatch):
+    gen = generate(db).num(1).with_fixed_values_for(a=0)\
+        .with_relative_values_for(label=lambda **k: k['user'].lower())
+
+    traced = []
+    monkeypatch.setattr(plan_module, 'trace_dependencies', lambda func: traced.append(func) or None)
+    for user in ('U1', 'U2', 'U3'):
+        rec, = gen._do(user=user)
+        assert rec.label == user.lower()
+    assert len(traced) == 2  # compiled, then laid out for `user`
+
+    rec, = gen.with_fixed_values_for(a=1)._do(user='U4')
+    assert (rec.a, rec.label) == (1, 'u4')
+
+
+def test_plan_is_immutable(db):
+    plan = generate(db).compile()
+    with pytest.raises(AttributeError):
+        plan.n = 10
+
+
+class NoSession(object):
+    def commit(self):
+        pass
+
+
+class NoDB(object):
+    session = NoSession()
+
+
+def test_plan_can_be_shared_between_threads():
+    created = []
+    lock = threading.Lock()
+
+    def create(M, **kwargs):
+        with lock:
+            created.append(kwargs)
+
+    plan = Generate(NoDB(), Record, create_func=create).num(1).with_fixed_values_for(a=1)\
+        .with_relative_values_for(b=lambda **k: k['a'] + k['user'])\
+        .compile()
+
+    threads = [threading.Thread(target=plan.run, kwargs={'user': i}) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(c['b'] for c in created) == list(range(1, 9))
+    assert all(c['user'] + 1 == c['b'] for c in created)
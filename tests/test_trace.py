@@ -0,0 +1,82 @@
+import sys
+from collections import namedtuple
+
+from dustbunny import Generate, depends_on
+from dustbunny.plan import trace_dependencies, _keys_from_instructions
+
+from .conftest import Record, add_to_session
+
+Instr = namedtuple('Instr', 'opname argval argrepr')
+
+
+def i(opname, argval=None, argrepr=''):
+    return Instr(opname, argval, argrepr)
+
+
+def local_then_mapping(**k):
+    x = 1
+    return x + k['b']
+
+
+def test_traces_constant_lookups():
+    assert trace_dependencies(lambda **k: k['a'] + k.get('b', 1) + ('c' in k)) == ('a', 'b', 'c')
+
+
+# 3.13+ loads two locals with one LOAD_FAST_LOAD_FAST (or LOAD_FAST_BORROW_LOAD_FAST_BORROW); when one of them is
+# the mapping, tracing gives up rather than mistake it for "k is never read"
+COMBINED_LOADS = sys.version_info >= (3, 13)
+
+
+def test_named_parameters_are_dependencies():
+    assert trace_dependencies(lambda a, **k: a + k['b']) == (None if COMBINED_LOADS else ('a', 'b'))
+    assert trace_dependencies(lambda a, **k: k['b'] + a) == ('a', 'b')
+
+
+def test_local_loaded_next_to_mapping():
+    assert trace_dependencies(local_then_mapping) == (None if COMBINED_LOADS else ('b',))
+
+
+def test_escaping_mapping_is_not_traced():
+    assert trace_dependencies(lambda **k: len(k)) is None
+    assert trace_dependencies(lambda **k: (lambda: k['a'])()) is None
+
+
+def test_declared_dependencies_win():
+    assert trace_dependencies(depends_on('z')(lambda **k: len(k))) == ('z',)
+
+
+def test_subscripts_by_interpreter():
+    # 3.10 and earlier
+    assert _keys_from_instructions(
+        [i('LOAD_FAST', 'k'), i('LOAD_CONST', 'b'), i('BINARY_SUBSCR'), i('RETURN_VALUE')], 'k') == ('b',)
+    # 3.14
+    assert _keys_from_instructions(
+        [i('LOAD_FAST_BORROW', 'k'), i('LOAD_CONST', 'b'), i('BINARY_OP', 26, '[]'), i('RETURN_VALUE')], 'k') == ('b',)
+
+
+def test_get_by_interpreter():
+    # 3.11 and earlier
+    assert _keys_from_instructions([i('LOAD_FAST', 'k'), i('LOAD_METHOD', 'get'), i('LOAD_CONST', 'a')], 'k') == ('a',)
+    # 3.12+
+    assert _keys_from_instructions([i('LOAD_FAST', 'k'), i('LOAD_ATTR', 'get'), i('LOAD_CONST', 'a')], 'k') == ('a',)
+
+
+def test_combined_loads_are_not_traced():
+    # what 3.13 emits for `x + k['b']` and `a + k['b']`
+    assert _keys_from_instructions(
+        [i('LOAD_FAST_LOAD_FAST', ('x', 'k')), i('LOAD_CONST', 'b'), i('BINARY_SUBSCR'), i('BINARY_OP', 0)], 'k') \
+        is None
+
+
+def test_reassigned_mapping_is_not_traced():
+    assert _keys_from_instructions(
+        [i('LOAD_CONST', None), i('STORE_FAST', 'k'), i('LOAD_FAST', 'k'), i('LOAD_CONST', 'b'), i('BINARY_SUBSCR')],
+        'k') is None
+
+
+def test_untraceable_functions_still_get_every_value(db):
+    recs = Generate(db, Record, create_func=add_to_session(db)).num(1)\
+        .with_fixed_values_for(a=1, b=2)\
+        .with_relative_values_for(label=local_then_mapping, user=lambda a, **k: str(a + k['b']))\
+        .execute()
+    assert [(r.label, r.user) for r in recs] == [('3', '3')]